@@ -1,6 +1,41 @@
+import logging;
 import numpy as np;
 import cv2;
-from typing import List, Dict, Any, Optional, Tuple;
+from collections import deque;
+from typing import List, Dict, Any, Optional, Tuple, Deque;
+
+try:
+    from numba import njit;
+    _HAS_NUMBA: bool = True;
+except ImportError:
+    _HAS_NUMBA: bool = False;
+
+logger = logging.getLogger(__name__);
+
+
+if _HAS_NUMBA:
+    @njit(cache=True)
+    def _inRealms_nb(pts: np.ndarray, form: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        **Description**
+        JIT-compiled `hitBar._inRealms`: test N points against realmIn & realmOut, returns (mask_in, mask_out).
+        `form` = (nx, ny, c, ux, uy, cu, lengthSq, halfWidth), see `hitBar._cacheRealmForm`.
+        """
+        nx, ny, c, ux, uy, cu, lengthSq, halfWidth = form[0], form[1], form[2], form[3], form[4], form[5], form[6], form[7];
+        n = pts.shape[0];
+        mask_in  = np.zeros(n, dtype=np.bool_);
+        mask_out = np.zeros(n, dtype=np.bool_);
+        for j in range(n):
+            px = pts[j,0];
+            py = pts[j,1];
+            t = ux*px + uy*py + cu;
+            if t < 0 or t > lengthSq:
+                continue;
+            sdf = nx*px + ny*py + c;
+            mask_in[j]  = -halfWidth <= sdf and sdf <= 0;
+            mask_out[j] = 0 <= sdf and sdf <= halfWidth;
+        return mask_in, mask_out;
+
 
 class hitBar:
     """
@@ -13,14 +48,14 @@ class hitBar:
     - `imgSize`: The size of the reference image (height, width).
     - `startPoint`: The start point of the hit bar (x, y).
     - `endPoint`: The end point of the hit bar (x, y).
-    - `direction`: The normal vector of the line from startPoint to endPoint.
+    - `direction`: The unit normal vector of the line from startPoint to endPoint. Like the realms, it is fixed after construction.
     - `width`: The half-thickness (in pixels) for realmIn & realmOut.
     - `maxLength`: The maximum length of the history buffer. If exceeded, the oldest frame will be removed.
     - `realmIn`: The negative-side realm (4 points).
     - `realmOut`: The positive-side realm (4 points).
     - `name`: The name of the hit bar for debugging/logging.
     - `visualize`: Whether to draw the hit bar and realms in update method if an image is provided.
-    - `history`: A list storing the previous frames' detection results.
+    - `history`: A deque (bounded by `maxLength`) storing compact copies of the previous frames' detection results.
     - `monitoredCatagories`: The categories that need to be counted or checked.
     - `Accumulator`: A dictionary counting the crossing events.
 
@@ -28,8 +63,12 @@ class hitBar:
     - `__init__`: Initialize the hit bar with geometry and optional visualization switch.
     - `_monitor`: Monitor the hit bar with a list of categories.
     - `update`: Update the hit bar with a new detection result (the main logic to check crossing).
+    - `_buildOverlay`: Internal method to rasterize the realm overlay once per frame shape & dtype.
     - `_hasIn`: Check if this target was in realmIn in a previous frame.
-    - `_inRealm`: Internal method to check if a point is inside a 4-point polygon realm.
+    - `_indexNumProj`: Internal method to build a frame's {cat: {objID: numInCat}} lookup.
+    - `_cacheRealmForm`: Internal method to precompute the linear form describing both realms (and its axis-aligned special case).
+    - `_inRealms`: Internal method to check an (N,2) array of points against both realms.
+    - `_realmMasks`: Check an (N,2) array of points against both realms (Numba-accelerated if available).
     """
     def __init__(
         self,
@@ -98,11 +137,28 @@ class hitBar:
 
             self.realmIn  = np.array([A, B, BIn,  AIn],  dtype=np.float32);
             self.realmOut = np.array([A, B, BOut, AOut], dtype=np.float32);
-
-        self.history: List[Dict[str,Any]] = [];
+        self._cacheRealmForm();
+        # Integer (4,2) corners for drawing, the realms are static after construction
+        self._ptsIn_i32  = np.ascontiguousarray(self.realmIn.astype(np.int32));
+        self._ptsOut_i32 = np.ascontiguousarray(self.realmOut.astype(np.int32));
+        if _HAS_NUMBA:
+            # Pay the JIT compile cost here rather than on the first frame
+            self._realmMasks(np.zeros((1,2), dtype=np.float32));
+
+        # Drawing buffers & realm overlay, built on the first visualized frame
+        self._outBuf: Optional[np.ndarray] = None;
+        self._blendBuf: Optional[np.ndarray] = None;
+        self._overlayColor: Optional[np.ndarray] = None;
+        self._overlayMask: Optional[np.ndarray] = None;
+        self._roi: Optional[Tuple[int,int,int,int]] = None;
+
+        self.history: Deque[Dict[str,Any]] = deque(maxlen=self.maxLength);
         self.Accumulator: Dict[str,int] = {};
         self.monitoredCatagories: List[str] = [];
+        self._monitoredSet: frozenset = frozenset();
         self.evenBetterResult: Dict[str,Any] = {};
+        # Hitting events of the current frame, logged in one go at the end of `update`
+        self._pendingLog: List[Tuple[str, str, Optional[int], int, int]] = [];
 
         if monitor:
             self._monitor(monitor);
@@ -122,6 +178,7 @@ class hitBar:
             if cat not in self.Accumulator:
                 self.Accumulator[cat] = 0;
         self.monitoredCatagories = list(set(self.monitoredCatagories + categories));
+        self._monitoredSet = frozenset(self.monitoredCatagories);
 
     def update(self, img: np.ndarray, detailedResult: Dict[str,Any]) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
         """
@@ -135,7 +192,9 @@ class hitBar:
 
         **Returns**  
         (imgOut, self.Accumulator)  
-        - `imgOut`: The new image with the bar drawn (if visualize & 'img' present)
+        - `imgOut`: The new image with the bar drawn (if visualize & 'img' present).
+          If `visualize=False` this is `img` itself, not a copy, so do not mutate it expecting `img` to stay untouched.
+          If `visualize=True` this is an internal buffer that is overwritten by the next call.
         - `evenBetterResult`: A dictionary of hitting events.
         - 
         """
@@ -145,129 +204,227 @@ class hitBar:
             "hitDetails":[],
             "Accumulator": {}
         }
-        self.history.append(detailedResult);
-        if len(self.history) > self.maxLength:
-            self.history.pop(0);
-        self.Accumulator = {cat:0 for cat in self.monitoredCatagories};
+        labels    = detailedResult.get("labels", []);
+        IDs       = detailedResult.get("IDs", []);
+        midPoints = detailedResult.get("midPoints", []);
 
-        # Recalculate realmIn and realmOut as parallelograms
-        A = np.array(self.startPoint, dtype=np.float32);
-        B = np.array(self.endPoint, dtype=np.float32);
-        
-        offsetIn  = -self.width * self.direction;
-        offsetOut = self.width * self.direction;
+        # midPoints as one contiguous (N,2) float32 array, consumed by the realm tests
+        pts = np.ascontiguousarray(np.asarray(midPoints, dtype=np.float32).reshape(-1,2));
 
-        AIn  = A + offsetIn;
-        BIn  = B + offsetIn;
-        AOut = A + offsetOut;
-        BOut = B + offsetOut;
+        # One pass over the midPoints yields both realm masks. The realms are static, so the realmIn
+        # mask is kept with the frame and reused by the next frame's `_hasIn` instead of retesting.
+        insideIn, insideOut = self._realmMasks(pts);
 
-        self.realmIn  = np.array([AIn, BIn, B, A], dtype=np.float32);
-        self.realmOut = np.array([AOut, BOut, B, A], dtype=np.float32);
+        # Keep only what `_hasIn` needs (no image or other payloads), with a (cat, objID) => index lookup
+        frame = {"labels": labels, "IDs": IDs, "midPoints": pts, "_insideIn": insideIn, "_index": {}};
+        if "numProjection" in detailedResult:
+            frame["numProjection"] = detailedResult["numProjection"];
+        for i, lb in enumerate(labels):
+            frame["_index"].setdefault((lb, IDs[i] if len(IDs) == len(labels) else i), i);
+        self.history.append(frame);
+        self.Accumulator = {cat:0 for cat in self.monitoredCatagories};
+        self._pendingLog.clear();
 
-        self.imgOut = img.copy();
+        self.imgOut = img;
         if self.visualize:
-            # Draw the centerline in solid red
-            cv2.line(self.imgOut, self.startPoint, self.endPoint, (0,0,255), 2);
-        # Create an overlay for transparency
-            overlay = img.copy();
-
-            # Convert realmIn and realmOut to integer points
-            ptsIn  = np.int32(self.realmIn.reshape(-1,1,2));
-            ptsOut = np.int32(self.realmOut.reshape(-1,1,2));
-
-            # Fill the realms with semi-transparent colors
-            cv2.fillPoly(overlay, [ptsIn], (0,0,255,100));  # Red with transparency
-            cv2.fillPoly(overlay, [ptsOut], (255,0,0,100));  # Blue with transparency
-
-            # Blend the overlay with the original image
-            alpha = 0.4;  # Transparency level (0: fully transparent, 1: fully opaque)
-            self.imgOut = cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0);
-
+            # Rasterize the static realm overlay only when the frame shape or dtype changes
+            if self._outBuf is None or self._outBuf.shape != img.shape or self._outBuf.dtype != img.dtype:
+                self._buildOverlay(img.shape, img.dtype);
+                self._outBuf = np.empty_like(img);
+            np.copyto(self._outBuf, img);
+
+            # Blend the realm colors with the image, inside the bar's bounding rect only
+            if self._roi is not None:
+                x0, y0, x1, y1 = self._roi;
+                roi = self._outBuf[y0:y1, x0:x1];
+                alpha = 0.4;  # Transparency level (0: fully transparent, 1: fully opaque)
+                cv2.addWeighted(self._overlayColor, alpha, roi, 1 - alpha, 0, dst=self._blendBuf);
+                np.copyto(roi, self._blendBuf, where=self._overlayMask);
 
+            # Draw the centerline in solid red
+            cv2.line(self._outBuf, self.startPoint, self.endPoint, (0,0,255), 2);
+            self.imgOut = self._outBuf;
 
-        labels    = detailedResult.get("labels", []);
-        IDs       = detailedResult.get("IDs", []);
-        midPoints = detailedResult.get("midPoints", []);
+        pastInside = self.history[-2]["_insideIn"] if len(self.history) > 1 else None;
 
-        for idx, pt in enumerate(midPoints):
+        for idx in np.flatnonzero(insideOut).tolist():
             cat = labels[idx];
-            if cat not in self.monitoredCatagories:
+            if cat not in self._monitoredSet:
                 continue;
             objID = IDs[idx] if len(IDs) == len(labels) else idx;
 
-            numInCat = None;
-            if "numProjection" in detailedResult and cat in detailedResult["numProjection"]:
-                arr = [x[1] for x in detailedResult["numProjection"][cat] if x[0] == objID];
-                if arr:
-                    numInCat = arr[0];
-
-            if self._inRealm(pt, self.realmOut):
-                if self._hasIn(pt, cat, objID, numInCat):
-                    self.Accumulator[cat] += 1;
-                    print(f"[{self.name}] {cat} No.{numInCat} (ID={objID})  count={self.Accumulator[cat]};");
-                    self.evenBetterResult["hitDetails"].append({
-                        "cat": cat,
-                        "ID": objID,
-                        "numInCat": numInCat
-                    });
+            numInCat = self._indexNumProj(frame).get(cat, {}).get(objID);
+
+            if self._hasIn(cat, objID, numInCat, pastInside):
+                self.Accumulator[cat] += 1;
+                self._pendingLog.append((self.name, cat, numInCat, objID, self.Accumulator[cat]));
+                self.evenBetterResult["hitDetails"].append({
+                    "cat": cat,
+                    "ID": objID,
+                    "numInCat": numInCat
+                });
+        # Emit the frame's hitting events at once, and only if someone listens
+        if self._pendingLog and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("\n".join(f"[{name}] {cat} No.{num} (ID={objID})  count={count};"
+                                   for name, cat, num, objID, count in self._pendingLog));
         self.evenBetterResult["Accumulator"] = self.Accumulator;
         return self.imgOut, self.evenBetterResult;
 
-    def _hasIn(self, pt: Tuple[int, int], cat: str, objID: int, numInCat: Optional[int]) -> bool:
+    def _buildOverlay(self, shape: Tuple[int, ...], dtype: np.dtype) -> None:
+        """
+        **Description**  
+        Rasterize realmIn (red) & realmOut (blue) once for frames of the given shape & dtype,
+        keeping only the part inside the bar's bounding rect.
+
+        **Params**  
+        - `shape`: The shape of the frames to draw on, (H, W) or (H, W, C).
+        - `dtype`: The dtype of the frames to draw on.
+
+        **Returns**  
+        None;
+        """
+        H, W = shape[:2];
+        x, y, w, h = cv2.boundingRect(np.vstack([self._ptsIn_i32, self._ptsOut_i32]));
+        x0, y0 = max(x, 0), max(y, 0);
+        x1, y1 = min(x + w, W), min(y + h, H);
+        if x1 <= x0 or y1 <= y0:
+            # The bar lies outside the frame, nothing to blend
+            self._roi = None;
+            return;
+        self._roi = (x0, y0, x1, y1);
+
+        # Corners relative to the bounding rect. The realms are convex quads, no need for the general
+        # polygon rasterizer; OpenCV takes as many color components as the image has channels.
+        ptsIn  = self._ptsIn_i32  - np.array([x0, y0], dtype=np.int32);
+        ptsOut = self._ptsOut_i32 - np.array([x0, y0], dtype=np.int32);
+        maskRoi = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8);
+        cv2.fillConvexPoly(maskRoi, ptsIn, 1);
+        cv2.fillConvexPoly(maskRoi, ptsOut, 1);
+        self._overlayColor = np.zeros((y1 - y0, x1 - x0) + tuple(shape[2:]), dtype=dtype);
+        cv2.fillConvexPoly(self._overlayColor, ptsIn, (0,0,255,100));  # Red with transparency
+        cv2.fillConvexPoly(self._overlayColor, ptsOut, (255,0,0,100));  # Blue with transparency
+        self._overlayMask = (maskRoi > 0).reshape(maskRoi.shape + (1,) * (len(shape) - 2));
+        self._blendBuf = np.empty_like(self._overlayColor);
+
+    def _hasIn(self, cat: str, objID: int, numInCat: Optional[int], pastInside: Optional[np.ndarray]) -> bool:
         """
         **Description**  
         Check if the target (cat, objID) was in realmIn in a previous frame.
 
         **Params**  
-        - `pt`: The point to check.
         - `cat`: The category name.
         - `objID`: The object ID in that category.
         - `numInCat`: If used to differentiate multiple objects with same cat.
+        - `pastInside`: Mask of the previous frame's midPoints lying in realmIn, None if there is no previous frame.
 
         **Returns**  
         bool, True if found in realmIn before, else False.
         """
-        try:
-            pastFrame = self.history[-2];
-        except IndexError:
+        if pastInside is None:
             return False;
-        labs  = pastFrame.get("labels", []);
-        ids   = pastFrame.get("IDs", []);
-        mids  = pastFrame.get("midPoints", []);
-        if cat not in labs:
+        pastFrame = self.history[-2];
+        i = pastFrame["_index"].get((cat, objID));
+        if i is None:
             return False;
-        for i, lb in enumerate(labs):
-            if lb == cat:
-                checkID = ids[i] if len(ids) == len(labs) else i;
-                if checkID == objID:
-                    if ("numProjection" in pastFrame) and (numInCat is not None):
-                        arr = [x[1] for x in pastFrame["numProjection"].get(cat, []) if x[0] == objID];
-                        if not arr or arr[0] != numInCat:
-                            continue;
-                    oldPt = mids[i];
-                    if self._inRealm(oldPt, self.realmIn):
-                        self.direction = (self.direction + np.array([pt[0] - oldPt[0], pt[1] - oldPt[1]], dtype=np.float32));
-                        self.direction = self.direction / np.linalg.norm(self.direction);
-                        return True;
-        return False;
-
-    def _inRealm(self, point: Tuple[int,int], realm: np.ndarray) -> bool:
+        if ("numProjection" in pastFrame) and (numInCat is not None):
+            if self._indexNumProj(pastFrame).get(cat, {}).get(objID) != numInCat:
+                return False;
+        return bool(pastInside[i]);
+
+    def _indexNumProj(self, frame: Dict[str,Any]) -> Dict[str, Dict[int, int]]:
+        """
+        **Description**  
+        Build (once) and return the {cat: {objID: numInCat}} lookup of a history frame's numProjection.
+        The first projection of an objID wins, as with a linear scan.
+
+        **Params**  
+        - `frame`: A frame stored in `history`.
+
+        **Returns**  
+        Dict[str, Dict[int, int]], cached on the frame as `_numIdx`.
+        """
+        if "_numIdx" not in frame:
+            numIdx = {};
+            for cat, pairs in frame.get("numProjection", {}).items():
+                catIdx = numIdx[cat] = {};
+                for objID, num in pairs:
+                    catIdx.setdefault(objID, num);
+            frame["_numIdx"] = numIdx;
+        return frame["_numIdx"];
+
+    def _cacheRealmForm(self) -> None:
+        """
+        **Description**
+        Precompute the linear form used by `_inRealms`. Both realms are rectangles along the bar, so with
+        `sdf = nx*x + ny*y + c` (signed distance to the bar, scaled by its length) and `t = ux*x + uy*y + cu`
+        (position along the bar, scaled by its length): realmIn is `0 <= t <= length**2, -halfWidth <= sdf <= 0`
+        and realmOut is `0 <= t <= length**2, 0 <= sdf <= halfWidth`, with `halfWidth = |width| * length`.
+        The coefficients are kept unnormalized in float64 so that points exactly on the bar stay exactly on it.
+
+        **Returns**
+        None;
+        """
+        Ax, Ay = float(self.startPoint[0]), float(self.startPoint[1]);
+        dx = float(self.endPoint[0]) - Ax;
+        dy = float(self.endPoint[1]) - Ay;
+        length = float(np.hypot(dx, dy));
+        # A zero-area realm (degenerate bar) contains no point
+        self._degenerate: bool = bool(length < 1e-6 or self.width == 0);
+        # Normal pointing into realmOut (flipped for a negative width), tangent from A to B
+        nx, ny = (-dy, dx) if self.width > 0 else (dy, -dx);
+        self._realmForm = np.array([nx, ny, -(nx*Ax + ny*Ay),
+                                    dx, dy, -(dx*Ax + dy*Ay),
+                                    length*length, abs(self.width)*length], dtype=np.float64);
+
+        # Horizontal & vertical bars: sdf only depends on the coordinate across the bar, t on the one along it
+        self._axisAligned: bool = not self._degenerate and (dx == 0 or dy == 0);
+        if self._axisAligned:
+            k = 1 if dy == 0 else 0;  # Axis across the bar
+            lo, hi = sorted((float(self.startPoint[1 - k]), float(self.endPoint[1 - k])));
+            self._axisForm = (k, (Ax, Ay)[k], float(np.sign((nx, ny)[k])), lo, hi, abs(self.width));
+
+    def _inRealms(self, pts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        **Description**
+        Check N points against both realms at once with the precomputed linear form,
+        or with plain coordinate compares for a horizontal/vertical bar.
+
+        **Params**
+        - `pts`: shape=(N,2) => points (x,y).
+
+        **Returns**
+        (maskIn, maskOut), two shape=(N,) bool masks, True if inside/on boundary.
+        """
+        if self._axisAligned:
+            k, c0, sign, lo, hi, halfWidth = self._axisForm;
+            sdf = sign*(pts[:,k].astype(np.float64) - c0);
+            along = (pts[:,1-k] >= lo) & (pts[:,1-k] <= hi);
+        else:
+            nx, ny, c, ux, uy, cu, lengthSq, halfWidth = self._realmForm;
+            x = pts[:,0].astype(np.float64);
+            y = pts[:,1].astype(np.float64);
+            sdf = nx*x + ny*y + c;
+            t   = ux*x + uy*y + cu;
+            along = (t >= 0) & (t <= lengthSq);
+        return along & (sdf >= -halfWidth) & (sdf <= 0), along & (sdf >= 0) & (sdf <= halfWidth);
+
+    def _realmMasks(self, pts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """
         **Description**
-        Check if a point is inside the 4-point polygon realm.
+        Check N points against both realms, with the Numba kernel if available, else with `_inRealms`.
+        A degenerate bar has empty realms.
 
         **Params**
-        - `point`: (x,y);
-        - `realm`: shape=(4,2) => corners of realm.
+        - `pts`: shape=(N,2) => points (x,y).
 
         **Returns**
-        bool, True if inside/on boundary, else False.
+        (maskIn, maskOut), two shape=(N,) bool masks.
         """
-        px, py = point;
-        contour = realm.reshape(-1,1,2);
-        inside = cv2.pointPolygonTest(contour, (px, py), False);
-        return inside >= 0;
+        if self._degenerate:
+            return np.zeros(len(pts), dtype=bool), np.zeros(len(pts), dtype=bool);
+        if _HAS_NUMBA:
+            return _inRealms_nb(np.ascontiguousarray(pts, dtype=np.float32), self._realmForm);
+        return self._inRealms(pts);
     
 
 if __name__ == "__main__":
@@ -275,6 +432,10 @@ if __name__ == "__main__":
     A dynamic demo that repeatedly calls update as the main method, 
     simulating a moving object in multiple frames;
     """
+    # Show the hitting events logged by `update`
+    logging.basicConfig(format="%(message)s");
+    logger.setLevel(logging.DEBUG);
+
     # Grey background
     H, W = 600, 800;
     bg = np.ones((H, W, 3), dtype=np.uint8) * 200;